@@ -10,16 +10,66 @@ To use with conda environment:
 
 import os
 import sys
+import io
+import csv
+import base64
 import time
 import random
 import string
+import threading
+import queue
 import psycopg2
-from psycopg2.extras import execute_batch
-from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import execute_batch, execute_values
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from decimal import Decimal
 from typing import List, Tuple, Dict
 import argparse
 
+# asyncpg is optional: when installed, --asyncpg switches the insert phase
+# to its Cython binary protocol and COPY BINARY bulk API
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+# psycopg 3 is optional: when installed, --pipeline switches the insert
+# phase to libpq pipeline mode, which queues row-level INSERTs without
+# waiting on per-statement round-trips
+try:
+    import psycopg
+except ImportError:
+    psycopg = None
+
+# NumPy is optional: when installed, row batches are generated columnwise
+# instead of one random call per cell, which is far faster for big batches
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Alphanumeric charset used for generated string payloads
+CHARSET = string.ascii_letters + string.digits
+
+# Per-thread RNGs: the module-global random instance serializes the worker
+# threads on its internal lock, so each thread gets its own state
+thread_rng = threading.local()
+
+def get_thread_rng() -> random.Random:
+    """Return this thread's random.Random, seeded once from OS entropy"""
+    rng = getattr(thread_rng, "rng", None)
+    if rng is None:
+        rng = random.Random(os.urandom(8))
+        thread_rng.rng = rng
+    return rng
+
+def get_thread_nprng():
+    """Return this thread's numpy Generator (requires NumPy)"""
+    rng = getattr(thread_rng, "nprng", None)
+    if rng is None:
+        rng = np.random.default_rng()
+        thread_rng.nprng = rng
+    return rng
+
 # Colors for output
 class Colors:
     RED = '\033[0;31m'
@@ -29,146 +79,390 @@ class Colors:
     NC = '\033[0m'  # No Color
 
 def generate_random_string(length: int = 32) -> str:
-    """Generate a random alphanumeric string"""
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
+    """Generate a random string from bulk OS entropy
+
+    base64 over os.urandom is much faster than a random.choices loop;
+    the payload is just filler, so cryptographic quality is irrelevant
+    but comes for free.
+    """
+    return base64.b64encode(os.urandom(length))[:length].decode('ascii')
 
 def generate_table_name() -> str:
     """Generate a random table name: stress_table_RANDOM"""
-    # Generate a random suffix (12 characters for better uniqueness)
-    # Use both uppercase and lowercase letters plus digits
-    suffix = ''.join(random.choices(string.ascii_letters + string.digits, k=12))
+    # 12 hex characters (48 bits) is plenty to avoid name collisions
+    suffix = os.urandom(6).hex()
     return f"stress_table_{suffix}"
 
-def generate_column_definitions(num_cols: int) -> List[Tuple[str, str]]:
-    """Generate column definitions with random types"""
+# Column type codes: index into TYPE_MAP and the generator dispatch tables
+TYPE_TEXT, TYPE_INT, TYPE_BIGINT, TYPE_VARCHAR, TYPE_NUMERIC = range(5)
+
+TYPE_MAP = {
+    TYPE_TEXT: ('TEXT', 'text'),
+    TYPE_INT: ('INTEGER', 'int'),
+    TYPE_BIGINT: ('BIGINT', 'bigint'),
+    TYPE_VARCHAR: ('VARCHAR(255)', 'varchar'),
+    TYPE_NUMERIC: ('NUMERIC(10,2)', 'numeric')
+}
+
+def generate_column_definitions(num_cols: int) -> List[Tuple[str, str, int]]:
+    """Generate column definitions with random types as (name, SQL type, type code)
+
+    The type code indexes the generator dispatch tables below, so row
+    generation never re-inspects the SQL type string.
+    """
     columns = []
-    type_map = {
-        0: ('TEXT', 'text'),
-        1: ('INTEGER', 'int'),
-        2: ('BIGINT', 'bigint'),
-        3: ('VARCHAR(255)', 'varchar'),
-        4: ('NUMERIC(10,2)', 'numeric')
-    }
+    rng = get_thread_rng()
     for i in range(1, num_cols + 1):
         # Use random selection instead of modulo to ensure variety
-        col_type, col_suffix = type_map[random.randint(0, 4)]
+        code = rng.randint(0, 4)
+        col_type, col_suffix = TYPE_MAP[code]
         col_name = f"col_{i}_{col_suffix}"
-        columns.append((col_name, col_type))
+        columns.append((col_name, col_type, code))
     return columns
 
-def generate_row_values(columns: List[Tuple[str, str]]) -> Tuple:
-    """Generate a single row of random values matching column types"""
-    values = []
-    for col_name, col_type in columns:
-        if 'INTEGER' in col_type:
-            values.append(random.randint(0, 1000000))
-        elif 'BIGINT' in col_type:
-            values.append(random.randint(0, 2**31) * random.randint(0, 2**31))
-        elif 'VARCHAR' in col_type:
-            values.append(generate_random_string(100))
-        elif 'NUMERIC' in col_type:
-            values.append(round(random.uniform(0, 10000), 2))
-        elif 'TEXT' in col_type:
-            values.append(generate_random_string(50))
-        else:
-            # Default to string if unknown type
-            values.append(generate_random_string(50))
-    return tuple(values)
+def generate_string_column(rng, num_rows: int, length: int) -> List[str]:
+    """Generate a column of random alphanumeric strings with NumPy"""
+    charset = np.frombuffer(CHARSET.encode("ascii"), dtype=np.uint8)
+    idx = rng.integers(0, len(charset), size=(num_rows, length))
+    data = charset[idx].tobytes()
+    return [data[i * length:(i + 1) * length].decode("ascii") for i in range(num_rows)]
 
-def table_exists(conn, table_name: str) -> bool:
-    """Check if a table already exists"""
+# Per-cell value generators, indexed by type code (scalar fallback path)
+ROW_GENERATORS = [
+    lambda rng: generate_random_string(50),                     # TEXT
+    lambda rng: rng.randint(0, 1000000),                        # INTEGER
+    lambda rng: rng.randint(0, 2**31) * rng.randint(0, 2**31),  # BIGINT
+    lambda rng: generate_random_string(100),                    # VARCHAR
+    lambda rng: round(rng.uniform(0, 10000), 2),                # NUMERIC
+]
+
+# Columnwise generators, indexed by type code (NumPy path); .tolist() yields
+# plain Python values, which psycopg2 adapts directly
+BATCH_GENERATORS = [
+    lambda rng, n: generate_string_column(rng, n, 50),                    # TEXT
+    lambda rng, n: rng.integers(0, 1000001, size=n).tolist(),             # INTEGER
+    lambda rng, n: rng.integers(0, 2**62, size=n).tolist(),               # BIGINT
+    lambda rng, n: generate_string_column(rng, n, 100),                   # VARCHAR
+    lambda rng, n: np.round(rng.uniform(0, 10000, size=n), 2).tolist(),   # NUMERIC
+]
+
+def generate_column(code: int, num_rows: int) -> list:
+    """Generate one column of num_rows random values for a type code"""
+    if np is None:
+        rng = get_thread_rng()
+        gen = ROW_GENERATORS[code]
+        return [gen(rng) for _ in range(num_rows)]
+    return BATCH_GENERATORS[code](get_thread_nprng(), num_rows)
+
+# Shared column pool: payload content doesn't matter for the stress test, so
+# columns of the same type and length are recycled across tables and batches
+# instead of re-rolling the RNG for every cell of every table
+COLUMN_POOL_SIZE = 8
+column_pool: Dict[Tuple[int, int], List[list]] = {}
+column_pool_lock = threading.Lock()
+
+def get_pooled_column(code: int, num_rows: int) -> list:
+    """Return a column for (type code, length), reusing earlier ones
+
+    The first COLUMN_POOL_SIZE columns per key are generated for real;
+    after that a random pooled one is handed back, so RNG work per run
+    is bounded by the pool size rather than tables * rows.
+    """
+    key = (code, num_rows)
+    with column_pool_lock:
+        pool = column_pool.setdefault(key, [])
+        if len(pool) >= COLUMN_POOL_SIZE:
+            return pool[get_thread_rng().randrange(COLUMN_POOL_SIZE)]
+
+    # Generate outside the lock so workers don't serialize on the RNG work
+    column = generate_column(code, num_rows)
+    with column_pool_lock:
+        pool = column_pool[key]
+        if len(pool) < COLUMN_POOL_SIZE:
+            pool.append(column)
+    return column
+
+def generate_batch_values(columns: List[Tuple[str, str, int]], num_rows: int) -> List[Tuple]:
+    """Generate a whole batch of rows from pooled random columns
+
+    Rows are assembled by zipping one pooled column per table column, so
+    different tables share payload content but keep their own shapes.
+    """
+    column_arrays = [get_pooled_column(code, num_rows) for _, _, code in columns]
+    return list(zip(*column_arrays))
+
+def create_tables(conn, table_specs: Dict[str, List[Tuple[str, str, int]]],
+                  on_progress=None) -> bool:
+    """Create all stress tables in a single transaction
+
+    Creation is optimistic: no information_schema precheck, just
+    CREATE TABLE IF NOT EXISTS, and every CREATE rides the same
+    transaction so the whole DDL phase costs one commit instead of one
+    per table. A racing CREATE that still hits a catalog
+    unique-violation rolls the batch back so the caller can retry with
+    fresh names.
+
+    Tables are created bare: no primary key and no created_at index, so
+    the bulk load never pays for btree maintenance. post_load_index adds
+    both once the data is in.
+    """
     try:
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' AND table_name = %s
-                );
-            """, (table_name,))
-            return cur.fetchone()[0]
+            for idx, (table_name, columns) in enumerate(table_specs.items(), 1):
+                # Build column definitions
+                col_defs = ", ".join([f"{name} {type_}" for name, type_, _ in columns])
+
+                # Create table
+                cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table_name} (
+                        id BIGINT GENERATED ALWAYS AS IDENTITY,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        {col_defs}
+                    );
+                """)
+
+                if on_progress:
+                    on_progress(idx, len(table_specs))
+
+        conn.commit()
+        return True
+    except (psycopg2.errors.DuplicateTable, psycopg2.errors.UniqueViolation):
+        conn.rollback()
+        return False
     except Exception as e:
-        print(f"{Colors.YELLOW}Warning: Could not check if table exists: {e}{Colors.NC}")
+        print(f"{Colors.RED}ERROR: Failed to create tables: {e}{Colors.NC}")
+        conn.rollback()
         return False
 
-def create_table(conn, table_name: str, columns: List[Tuple[str, str]]) -> bool:
-    """Create a table with the specified columns"""
+# Per-table SQL cache so repeated batches don't rebuild the same strings
+sql_cache: Dict[str, Tuple[str, str, str]] = {}
+
+def get_table_sql(table_name: str, columns: List[Tuple[str, str, int]]) -> Tuple[str, str, str]:
+    """Return the (COPY, COPY FREEZE, INSERT) statements for a table, cached"""
+    cached = sql_cache.get(table_name)
+    if cached is None:
+        col_list = ", ".join(name for name, _, _ in columns)
+        copy_sql = f"COPY {table_name} ({col_list}) FROM STDIN WITH (FORMAT CSV)"
+        copy_freeze_sql = f"COPY {table_name} ({col_list}) FROM STDIN WITH (FORMAT CSV, FREEZE)"
+        insert_sql = f"INSERT INTO {table_name} ({col_list}) VALUES %s"
+        cached = (copy_sql, copy_freeze_sql, insert_sql)
+        sql_cache[table_name] = cached
+    return cached
+
+def prepare_insert(conn, table_name: str, columns: List[Tuple[str, str, int]]) -> str:
+    """PREPARE a server-side single-row INSERT and return its statement name
+
+    Later EXECUTEs skip the per-statement parse/plan work. Prepared
+    statements are session-scoped, so each worker connection prepares
+    its own before its first batch.
+    """
+    stmt_name = f"ins_{table_name}"
+    col_list = ", ".join(name for name, _, _ in columns)
+    arg_types = ", ".join(type_ for _, type_, _ in columns)
+    params = ", ".join(f"${i}" for i in range(1, len(columns) + 1))
+    with conn.cursor() as cur:
+        cur.execute(
+            f"PREPARE {stmt_name} ({arg_types}) AS "
+            f"INSERT INTO {table_name} ({col_list}) VALUES ({params})"
+        )
+    return stmt_name
+
+def rows_to_csv_buffer(rows: List[Tuple]) -> io.StringIO:
+    """Serialize rows into an in-memory CSV stream suitable for COPY FROM STDIN"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerows(rows)
+    buf.seek(0)
+    return buf
+
+def insert_batch(conn, table_name: str, columns: List[Tuple[str, str, int]],
+                 rows: List[Tuple], batch_num: int, total_batches: int,
+                 use_copy: bool = True, stmt_name: str = None,
+                 freeze: bool = False) -> int:
+    """Insert a batch of rows using COPY FROM STDIN for speed
+
+    COPY ships the whole batch as a single stream, avoiding per-row
+    statement parsing and round-trips. Pass use_copy=False to fall back
+    to row-level INSERTs (useful when triggers need row-level semantics),
+    driven through the server-side prepared statement when one is given.
+    freeze=True adds FREEZE, which is only legal while the table was
+    created or truncated in the current transaction.
+
+    Committing is the caller's responsibility: batches accumulate in the
+    caller's transaction so a whole table costs a single commit/fsync.
+    On error the transaction is rolled back, taking any earlier
+    uncommitted batches with it.
+    """
     try:
+        copy_sql, copy_freeze_sql, insert_sql = get_table_sql(table_name, columns)
+
         with conn.cursor() as cur:
-            # Check if table already exists - if so, skip creation
-            cur.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' AND table_name = %s
-                );
-            """, (table_name,))
-            if cur.fetchone()[0]:
-                # Table already exists, skip
-                return False
-            
-            # Build column definitions
-            col_defs = ", ".join([f"{name} {type_}" for name, type_ in columns])
-            
-            # Create table
-            cur.execute(f"""
-                CREATE TABLE {table_name} (
-                    id SERIAL PRIMARY KEY,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    {col_defs}
-                );
-            """)
-            
-            # Create index
-            cur.execute(f"""
-                CREATE INDEX IF NOT EXISTS idx_{table_name}_created 
-                ON {table_name}(created_at);
-            """)
-            
-            conn.commit()
-            return True
+            if use_copy:
+                buf = rows_to_csv_buffer(rows)
+                cur.copy_expert(copy_freeze_sql if freeze else copy_sql, buf)
+            elif stmt_name:
+                # Each EXECUTE reuses the already-parsed-and-planned statement
+                placeholders = ", ".join(["%s"] * len(columns))
+                execute_batch(cur, f"EXECUTE {stmt_name} ({placeholders})",
+                              rows, page_size=len(rows))
+            else:
+                # execute_values builds a single multi-VALUES INSERT,
+                # noticeably faster than execute_batch's statement list
+                execute_values(cur, insert_sql, rows, page_size=10000)
+            return len(rows)
     except Exception as e:
-        print(f"{Colors.RED}ERROR: Failed to create table {table_name}: {e}{Colors.NC}")
+        print(f"{Colors.RED}ERROR: Failed to insert batch {batch_num}/{total_batches} into {table_name}: {e}{Colors.NC}")
         conn.rollback()
-        return False
+        return 0
+
+def insert_all_tables_asyncpg(args, table_columns: Dict[str, List[Tuple[str, str, int]]],
+                              table_names_list: List[str], rows_per_table: int,
+                              batch_size: int, on_progress) -> int:
+    """Insert phase on asyncpg: all tables loaded concurrently on one event loop
 
-def insert_batch(conn, table_name: str, columns: List[Tuple[str, str]], 
-                 rows: List[Tuple], batch_num: int, total_batches: int) -> int:
-    """Insert a batch of rows using execute_batch for speed"""
+    copy_records_to_table streams batches with COPY BINARY, so a single
+    thread can keep every table loading at once without the
+    per-connection worker threads the psycopg2 path needs.
+    """
+    import asyncio
+
+    # uvloop shaves some latency off the event loop when available
     try:
-        col_names = [name for name, _ in columns]
-        placeholders = ", ".join(["%s"] * len(col_names))
-        col_list = ", ".join(col_names)
-        
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+
+    async def insert_table(pool, table_name: str) -> int:
+        columns = table_columns[table_name]
+        col_names = [name for name, _, _ in columns]
+        # asyncpg's binary codec wants Decimal (not float) for NUMERIC
+        numeric_idx = {i for i, (_, _, code) in enumerate(columns) if code == TYPE_NUMERIC}
+        rows_inserted = 0
+        num_batches = (rows_per_table + batch_size - 1) // batch_size
+
+        async with pool.acquire() as conn:
+            # Async commit for the load: don't wait on WAL flush/replication
+            # per batch; a crash loses only the tail of this session's work
+            await conn.execute("SET synchronous_commit TO off;")
+            for batch_num in range(1, num_batches + 1):
+                rows_in_batch = min(batch_size, rows_per_table - (batch_num - 1) * batch_size)
+                batch_data = generate_batch_values(columns, rows_in_batch)
+                if numeric_idx:
+                    batch_data = [
+                        tuple(Decimal(str(v)) if i in numeric_idx else v
+                              for i, v in enumerate(row))
+                        for row in batch_data
+                    ]
+                await conn.copy_records_to_table(table_name, records=batch_data,
+                                                 columns=col_names)
+                rows_inserted += rows_in_batch
+                on_progress(rows_in_batch)
+        return rows_inserted
+
+    async def run() -> int:
+        pool = await asyncpg.create_pool(
+            host=args.host,
+            port=args.port,
+            database=args.database,
+            user=args.user,
+            password=args.password,
+            min_size=args.threads,
+            max_size=args.threads + 2
+        )
+        try:
+            results = await asyncio.gather(
+                *[insert_table(pool, table_name) for table_name in table_names_list]
+            )
+        finally:
+            await pool.close()
+        return sum(results)
+
+    return asyncio.run(run())
+
+def insert_all_tables_pipeline(args, table_columns: Dict[str, List[Tuple[str, str, int]]],
+                               table_names_list: List[str], rows_per_table: int,
+                               batch_size: int, num_threads: int, on_progress) -> int:
+    """Insert phase on psycopg 3 pipeline mode
+
+    Every INSERT of a batch is queued on the connection without waiting
+    for its result, so row-level semantics (triggers etc.) are kept
+    while a batch costs one round-trip instead of one per statement.
+    prepare=True lets psycopg reuse the server-side plan after the first
+    execution.
+    """
+    def insert_table(table_name: str) -> int:
+        columns = table_columns[table_name]
+        col_list = ", ".join(name for name, _, _ in columns)
+        placeholders = ", ".join(["%s"] * len(columns))
         query = f"INSERT INTO {table_name} ({col_list}) VALUES ({placeholders})"
-        
-        with conn.cursor() as cur:
-            execute_batch(cur, query, rows, page_size=len(rows))
+        rows_inserted = 0
+        num_batches = (rows_per_table + batch_size - 1) // batch_size
+
+        with psycopg.connect(host=args.host, port=args.port, dbname=args.database,
+                             user=args.user, password=args.password) as conn:
+            conn.execute("SET synchronous_commit TO off;")
+            with conn.cursor() as cur:
+                for batch_num in range(1, num_batches + 1):
+                    rows_in_batch = min(batch_size, rows_per_table - (batch_num - 1) * batch_size)
+                    batch_data = generate_batch_values(columns, rows_in_batch)
+                    with conn.pipeline():
+                        for row in batch_data:
+                            cur.execute(query, row, prepare=True)
+                    rows_inserted += rows_in_batch
+                    on_progress(rows_in_batch)
+            # One commit for the whole table, as on the psycopg2 path
             conn.commit()
-            return len(rows)
+        return rows_inserted
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        return sum(executor.map(insert_table, table_names_list))
+
+def post_load_index(conn, table_name: str) -> bool:
+    """Build a table's primary key and created_at index after the bulk load
+
+    One sort per index over loaded data is far cheaper than maintaining
+    the btrees row by row during COPY, and roughly halves the insert WAL
+    traffic.
+    """
+    try:
+        with conn.cursor() as cur:
+            # A large maintenance_work_mem lets the index builds sort in memory
+            cur.execute("SET maintenance_work_mem = '1GB';")
+            cur.execute(f"ALTER TABLE {table_name} ADD PRIMARY KEY (id);")
+            cur.execute(f"""
+                CREATE INDEX IF NOT EXISTS idx_{table_name}_created
+                ON {table_name}(created_at);
+            """)
+        conn.commit()
+        return True
     except Exception as e:
-        print(f"{Colors.RED}ERROR: Failed to insert batch {batch_num}/{total_batches} into {table_name}: {e}{Colors.NC}")
+        print(f"{Colors.RED}ERROR: Failed to index table {table_name}: {e}{Colors.NC}")
         conn.rollback()
-        return 0
+        return False
 
-def update_table(conn, table_name: str, update_count: int, columns: List[Tuple[str, str]]) -> bool:
+def update_table(conn, table_name: str, update_count: int, columns: List[Tuple[str, str, int]]) -> bool:
     """Update random rows in a table"""
     try:
         with conn.cursor() as cur:
             # Find an integer column to update (prefer INTEGER or BIGINT)
             update_col = None
-            for col_name, col_type in columns:
-                if 'INTEGER' in col_type or 'BIGINT' in col_type:
+            for col_name, col_type, code in columns:
+                if code in (TYPE_INT, TYPE_BIGINT):
                     update_col = col_name
                     break
             
-            # If no integer column found, just update updated_at
+            # TABLESAMPLE SYSTEM grabs random pages instead of sorting the
+            # whole table by RANDOM(); the sample is page-clustered but that
+            # is fine for stress updates, and LIMIT caps the row count
             if update_col:
                 cur.execute(f"""
                     UPDATE {table_name}
                     SET updated_at = CURRENT_TIMESTAMP,
                         {update_col} = {update_col} + 1
                     WHERE id IN (
-                        SELECT id FROM {table_name} ORDER BY RANDOM() LIMIT %s
+                        SELECT id FROM {table_name} TABLESAMPLE SYSTEM (10) LIMIT %s
                     );
                 """, (update_count,))
             else:
@@ -177,7 +471,7 @@ def update_table(conn, table_name: str, update_count: int, columns: List[Tuple[s
                     UPDATE {table_name}
                     SET updated_at = CURRENT_TIMESTAMP
                     WHERE id IN (
-                        SELECT id FROM {table_name} ORDER BY RANDOM() LIMIT %s
+                        SELECT id FROM {table_name} TABLESAMPLE SYSTEM (10) LIMIT %s
                     );
                 """, (update_count,))
             conn.commit()
@@ -197,8 +491,19 @@ def query_table(conn, table_name: str) -> int:
         print(f"{Colors.RED}ERROR: Failed to query table {table_name}: {e}{Colors.NC}")
         return 0
 
+# Redraw the progress bar at most this often; each redraw is a flushed
+# terminal write, and per-batch redraws can stall the hot loops
+PROGRESS_INTERVAL = 0.1
+last_progress_time = 0.0
+
 def print_progress(current: int, total: int, prefix: str = ""):
-    """Print a progress bar"""
+    """Print a progress bar (sampled; the final update always prints)"""
+    global last_progress_time
+    now = time.monotonic()
+    if current < total and now - last_progress_time < PROGRESS_INTERVAL:
+        return
+    last_progress_time = now
+
     width = 50
     percentage = int(current * 100 / total) if total > 0 else 0
     filled = int(current * width / total) if total > 0 else 0
@@ -207,16 +512,30 @@ def print_progress(current: int, total: int, prefix: str = ""):
     bar = "=" * filled + " " * empty
     print(f"\r{prefix}[{bar}] {percentage:3d}% ({current}/{total})", end="", flush=True)
 
+def connect(args):
+    """Open a new psycopg2 connection from the parsed CLI args"""
+    return psycopg2.connect(
+        host=args.host,
+        port=args.port,
+        database=args.database,
+        user=args.user,
+        password=args.password
+    )
+
 def load_env_file():
-    """Load environment variables from .env file"""
+    """Load environment variables from .env file in one pass"""
     env_file = os.path.join(os.path.dirname(__file__), "..", ".env")
-    if os.path.exists(env_file):
+    try:
         with open(env_file) as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith("#") and "=" in line:
-                    key, value = line.split("=", 1)
-                    os.environ[key.strip()] = value.strip()
+            os.environ.update({
+                key.strip(): value.strip()
+                for key, value in (
+                    line.split("=", 1) for line in f
+                    if "=" in line and not line.lstrip().startswith("#")
+                )
+            })
+    except FileNotFoundError:
+        pass
 
 def main():
     # Load environment variables
@@ -230,7 +549,7 @@ def main():
                        help="Number of rows per table")
     parser.add_argument("--cols", type=int, default=int(os.getenv("COLS_PER_TABLE", "10")),
                        help="Number of columns per table")
-    parser.add_argument("--batch-size", type=int, default=int(os.getenv("BATCH_SIZE", "1000")),
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("BATCH_SIZE", "10000")),
                        help="Batch size for inserts")
     parser.add_argument("--threads", type=int, default=4,
                        help="Number of parallel threads")
@@ -244,6 +563,12 @@ def main():
                        help="Database user")
     parser.add_argument("--password", default=os.environ["POSTGRES_PASSWORD"],
                        help="Database password")
+    parser.add_argument("--asyncpg", action="store_true",
+                       help="Use asyncpg (binary protocol COPY) for the insert phase if installed")
+    parser.add_argument("--pipeline", action="store_true",
+                       help="Use psycopg 3 pipeline mode (row-level INSERTs, batched round-trips) if installed")
+    parser.add_argument("--no-copy", action="store_true",
+                       help="Use batched INSERTs instead of COPY (slower, row-level semantics)")
     parser.add_argument("--debug", action="store_true",
                        help="Enable debug output")
     
@@ -273,30 +598,20 @@ def main():
     # Test connection
     print(f"{Colors.YELLOW}Checking database connectivity...{Colors.NC}")
     try:
-        test_conn = psycopg2.connect(
-            host=args.host,
-            port=args.port,
-            database=args.database,
-            user=args.user,
-            password=args.password
-        )
+        test_conn = connect(args)
         test_conn.close()
         print(f"{Colors.GREEN}✓ Database connection successful{Colors.NC}")
     except Exception as e:
         print(f"{Colors.RED}ERROR: Could not connect to database: {e}{Colors.NC}")
         sys.exit(1)
     print()
-    
-    # Create connection pool
-    pool = ThreadedConnectionPool(
-        minconn=1,
-        maxconn=num_threads + 2,
-        host=args.host,
-        port=args.port,
-        database=args.database,
-        user=args.user,
-        password=args.password
-    )
+
+    # Persistent connections, one per worker thread, checked out through a
+    # plain queue: unlike ThreadedConnectionPool the connections are opened
+    # once and stay open for the whole run, and checkout is just a get()
+    conn_pool = queue.Queue()
+    for _ in range(num_threads):
+        conn_pool.put(connect(args))
     
     start_time = time.time()
     
@@ -308,38 +623,27 @@ def main():
     # Store column definitions for each table (for later use in inserts)
     table_columns = {}
     
-    conn = pool.getconn()
+    conn = conn_pool.get()
     try:
-        created_count = 0
-        max_attempts = num_tables * 3  # Allow some retries for name collisions
-        attempts = 0
-        
-        while created_count < num_tables and attempts < max_attempts:
-            # Generate random table name
-            table_name = generate_table_name()
-            attempts += 1
-            
-            # Skip if table already exists
-            if table_exists(conn, table_name):
-                continue
-            
-            # Generate random column definitions for each table
-            columns = generate_column_definitions(cols_per_table)
-            if create_table(conn, table_name, columns):
-                # Only add to table_columns if table was successfully created
-                table_columns[table_name] = columns
-                created_count += 1
-                print_progress(created_count, num_tables)
-        
+        created = False
+        for attempt in range(3):  # Fresh names on the off chance of a collision
+            # Generate random names and column definitions for every table
+            table_columns = {}
+            while len(table_columns) < num_tables:
+                table_columns[generate_table_name()] = generate_column_definitions(cols_per_table)
+
+            if create_tables(conn, table_columns, on_progress=print_progress):
+                created = True
+                break
+
         print()
-        if created_count == num_tables:
+        if created:
             print(f"{Colors.GREEN}✓ All {num_tables} new tables created{Colors.NC}")
         else:
-            print(f"{Colors.YELLOW}⚠ Created {created_count} out of {num_tables} tables{Colors.NC}")
-            if attempts >= max_attempts:
-                print(f"{Colors.YELLOW}  (Reached max attempts, may have hit name collisions){Colors.NC}")
+            table_columns = {}
+            print(f"{Colors.YELLOW}⚠ Could not create tables (repeated name collisions){Colors.NC}")
     finally:
-        pool.putconn(conn)
+        conn_pool.put(conn)
     print()
     
     # Get the list of table names that were actually created
@@ -354,7 +658,6 @@ def main():
     total_rows = 0
     total_inserts = actual_num_tables * rows_per_table
     current_inserts = 0
-    import threading
     progress_lock = threading.Lock()
     
     def insert_table_data(table_name: str) -> int:
@@ -362,83 +665,202 @@ def main():
         nonlocal current_inserts
         # Get the column definitions for this specific table
         columns = table_columns[table_name]
-        conn = pool.getconn()
+        conn = conn_pool.get()
         rows_inserted = 0
-        
+
         try:
+            with conn.cursor() as cur:
+                # Async commit for the load: don't wait on WAL flush/replication
+                # per batch; a crash loses only the tail of this session's work
+                cur.execute("SET synchronous_commit TO off;")
+            conn.commit()
+
+            # The fallback path prepares its INSERT once per table so every
+            # batch skips parse/plan work
+            stmt_name = None
+            use_copy = not args.no_copy
+            if args.no_copy:
+                stmt_name = prepare_insert(conn, table_name, columns)
+            else:
+                # The table is freshly created and empty; truncating it in
+                # the same transaction as the first COPY makes FREEZE legal,
+                # so those rows are written already-frozen and skip the later
+                # VACUUM/visibility WAL work
+                with conn.cursor() as cur:
+                    cur.execute(f"TRUNCATE {table_name};")
+
             # Calculate batches
             num_batches = (rows_per_table + batch_size - 1) // batch_size
-            
-            for batch_num in range(1, num_batches + 1):
-                rows_in_batch = min(batch_size, rows_per_table - (batch_num - 1) * batch_size)
-                
-                # Generate batch data
-                batch_data = [generate_row_values(columns) for _ in range(rows_in_batch)]
-                
+
+            # Produce batches on a side thread so the next batch generates
+            # while the previous one is on the wire; maxsize=2 keeps at most
+            # one batch of lookahead in memory
+            batch_queue = queue.Queue(maxsize=2)
+
+            def produce_batches():
+                for batch_num in range(1, num_batches + 1):
+                    rows_in_batch = min(batch_size, rows_per_table - (batch_num - 1) * batch_size)
+                    batch_queue.put(generate_batch_values(columns, rows_in_batch))
+                batch_queue.put(None)
+
+            producer = threading.Thread(target=produce_batches, daemon=True)
+            producer.start()
+
+            batch_num = 0
+            while True:
+                batch_data = batch_queue.get()
+                if batch_data is None:
+                    break
+                batch_num += 1
+
                 # Insert batch
-                inserted = insert_batch(conn, table_name, columns, batch_data, batch_num, num_batches)
+                # Every batch rides the table's single transaction, so all
+                # of them can be frozen
+                inserted = insert_batch(conn, table_name, columns, batch_data, batch_num, num_batches,
+                                        use_copy=use_copy, stmt_name=stmt_name,
+                                        freeze=use_copy)
                 rows_inserted += inserted
-                
-                # Update progress (thread-safe)
+
+                # Update progress (thread-safe; print_progress samples the redraws)
                 with progress_lock:
                     current_inserts += inserted
-                    # Update progress more frequently for better feedback
-                    if batch_num % 5 == 0 or batch_num == num_batches:
-                        print_progress(current_inserts, total_inserts)
-            
-            # Final progress update for this table
-            with progress_lock:
-                print_progress(current_inserts, total_inserts)
+                    print_progress(current_inserts, total_inserts)
+
+                if inserted == 0:
+                    # The failed batch rolled back the whole table
+                    # transaction; back out this table's progress and start
+                    # a fresh transaction (re-TRUNCATE keeps FREEZE legal,
+                    # re-PREPARE restores the rolled-back statement)
+                    with progress_lock:
+                        current_inserts -= rows_inserted
+                    rows_inserted = 0
+                    if use_copy:
+                        with conn.cursor() as cur:
+                            cur.execute(f"TRUNCATE {table_name};")
+                    else:
+                        stmt_name = prepare_insert(conn, table_name, columns)
+
+            producer.join()
+
+            # One commit (and one fsync) for the whole table
+            conn.commit()
         finally:
-            pool.putconn(conn)
+            conn_pool.put(conn)
         
         return rows_inserted
     
+    use_asyncpg = args.asyncpg
+    if use_asyncpg and asyncpg is None:
+        print(f"{Colors.YELLOW}Warning: asyncpg not installed, using psycopg2 threads instead{Colors.NC}")
+        use_asyncpg = False
+    use_pipeline = args.pipeline
+    if use_pipeline and psycopg is None:
+        print(f"{Colors.YELLOW}Warning: psycopg 3 not installed, using psycopg2 threads instead{Colors.NC}")
+        use_pipeline = False
+
     # Insert data in parallel
-    with ThreadPoolExecutor(max_workers=num_threads) as executor:
-        futures = {executor.submit(insert_table_data, table_name): table_name for table_name in table_names_list}
-        for future in as_completed(futures):
-            total_rows += future.result()
+    if use_asyncpg:
+        def on_progress(inserted: int):
+            nonlocal current_inserts
+            # Single event loop thread, so no lock needed here
+            current_inserts += inserted
+            print_progress(current_inserts, total_inserts)
+
+        total_rows = insert_all_tables_asyncpg(args, table_columns, table_names_list,
+                                               rows_per_table, batch_size, on_progress)
+    elif use_pipeline:
+        def on_progress(inserted: int):
+            nonlocal current_inserts
+            with progress_lock:
+                current_inserts += inserted
+                print_progress(current_inserts, total_inserts)
+
+        total_rows = insert_all_tables_pipeline(args, table_columns, table_names_list,
+                                                rows_per_table, batch_size, num_threads,
+                                                on_progress)
+    else:
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            futures = {executor.submit(insert_table_data, table_name): table_name for table_name in table_names_list}
+            for future in as_completed(futures):
+                total_rows += future.result()
     
     print()
     print(f"{Colors.GREEN}✓ All data inserted ({total_rows} total rows){Colors.NC}")
     print()
-    
-    # Update rows
+
+    # Build primary keys and indexes now that the data is in
+    print(f"{Colors.YELLOW}Building indexes on loaded tables...{Colors.NC}")
+    indexes_done = 0
+
+    def index_table_data(table_name: str) -> bool:
+        conn = conn_pool.get()
+        try:
+            return post_load_index(conn, table_name)
+        finally:
+            conn_pool.put(conn)
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        futures = {executor.submit(index_table_data, table_name): table_name for table_name in table_names_list}
+        for future in as_completed(futures):
+            if future.result():
+                with progress_lock:
+                    indexes_done += 1
+                    print_progress(indexes_done, len(table_names_list))
+    print()
+    print(f"{Colors.GREEN}✓ Indexes built{Colors.NC}")
+    print()
+
+    # Update rows in parallel (one table per worker, same pool as inserts)
     print(f"{Colors.YELLOW}Updating random rows (10% of each table)...{Colors.NC}")
     update_count = max(1, rows_per_table // 10)
-    
-    conn = pool.getconn()
-    try:
-        for idx, table_name in enumerate(table_names_list, 1):
-            columns = table_columns[table_name]
-            if update_table(conn, table_name, update_count, columns):
-                print_progress(idx, len(table_names_list))
-        print()
-        print(f"{Colors.GREEN}✓ Updates completed{Colors.NC}")
-    finally:
-        pool.putconn(conn)
+    updates_done = 0
+
+    def update_table_data(table_name: str) -> bool:
+        conn = conn_pool.get()
+        try:
+            return update_table(conn, table_name, update_count, table_columns[table_name])
+        finally:
+            conn_pool.put(conn)
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        futures = {executor.submit(update_table_data, table_name): table_name for table_name in table_names_list}
+        for future in as_completed(futures):
+            if future.result():
+                with progress_lock:
+                    updates_done += 1
+                    print_progress(updates_done, len(table_names_list))
     print()
-    
-    # Run test queries
+    print(f"{Colors.GREEN}✓ Updates completed{Colors.NC}")
+    print()
+
+    # Run test queries in parallel, printing results in submission order
     print(f"{Colors.YELLOW}Running test queries...{Colors.NC}")
-    conn = pool.getconn()
-    try:
-        for i in range(1, 6):
-            table_name = random.choice(table_names_list) if table_names_list else f"stress_table_{random.randint(1, num_tables):03d}"
+
+    def query_table_data(table_name: str) -> int:
+        conn = conn_pool.get()
+        try:
+            return query_table(conn, table_name)
+        finally:
+            conn_pool.put(conn)
+
+    query_tables = [
+        random.choice(table_names_list) if table_names_list else f"stress_table_{random.randint(1, num_tables):03d}"
+        for _ in range(5)
+    ]
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        query_futures = [executor.submit(query_table_data, table_name) for table_name in query_tables]
+        for i, (table_name, future) in enumerate(zip(query_tables, query_futures), 1):
             print(f"  Query {i}/5: SELECT COUNT(*) FROM {table_name}...")
-            count = query_table(conn, table_name)
+            count = future.result()
             if count > 0:
                 print(f"    {Colors.GREEN}✓{Colors.NC} Count: {count} rows")
             else:
                 print(f"    {Colors.RED}✗{Colors.NC} Error running query")
-    finally:
-        pool.putconn(conn)
     print()
     
     # Database statistics
     print(f"{Colors.YELLOW}Database Statistics:{Colors.NC}")
-    conn = pool.getconn()
+    conn = conn_pool.get()
     try:
         with conn.cursor() as cur:
             cur.execute("""
@@ -456,7 +878,7 @@ def main():
             cur.execute(f"SELECT pg_size_pretty(pg_database_size('{args.database}'));")
             db_size = cur.fetchone()[0]
     finally:
-        pool.putconn(conn)
+        conn_pool.put(conn)
     
     end_time = time.time()
     duration = int(end_time - start_time)
@@ -475,8 +897,9 @@ def main():
     print(f"  {Colors.YELLOW}./scripts/testing/cleanup_stress_test.sh{Colors.NC}")
     print()
     
-    # Close connection pool
-    pool.closeall()
+    # Close the persistent connections
+    while not conn_pool.empty():
+        conn_pool.get_nowait().close()
 
 if __name__ == "__main__":
     main()